@@ -12,7 +12,7 @@ import sys
 import re
 import time
 
-from .resources import Resource, ResourceManager
+from .resources import Resource, ResourceManager, ExecutableResource
 from .feature import Feature, DummyFeature
 from .logger import Logger
 from .servicemgr import ServiceManager
@@ -36,6 +36,10 @@ class Driver:
 		self.workspace = None
 		self.journal_path = None
 		self._parameters = {}
+
+		# Spool completed test cases to disk rather than keeping
+		# the whole journal in memory (see JournalStreamWriter)
+		self.streamJournal = False
 		self._logger = None
 
 		self.resourceManager = ResourceManager(self)
@@ -131,6 +135,21 @@ class Driver:
 
 		return result
 
+	# Given a list of executable resource requirements, locate all the
+	# binaries on each node in one go rather than one command per resource.
+	def locateExecutables(self, requirements):
+		for node in self.targets:
+			executables = []
+			for req in requirements:
+				if req.nodeName is not None and req.nodeName != node.name:
+					continue
+
+				res = node.instantiateResourceTypeAndName("executable", req.resourceName, strict = False)
+				if res is not None and not res.is_active:
+					executables.append(res.executable or res.name)
+
+			ExecutableResource.locateBinaries(node, executables)
+
 	def getFeature(self, name):
 		return self._features.get(name)
 
@@ -172,10 +191,16 @@ class Driver:
 	def addTestResources(self, resourceDict):
 		self.testResources.update(resourceDict)
 
-	def beginSetup(self):
+	# executables is the list of executable requirements of the test
+	# script. We locate all of them in one go, so that acquiring them
+	# later does not have to run one command per executable.
+	def beginSetup(self, executables = None):
 		if self._setup_complete:
 			raise Exception("Duplicate call to beginSetup()")
 
+		if executables:
+			self.locateExecutables(executables)
+
 		group = self.beginGroup("setup")
 
 		for node in self.targets:
@@ -374,7 +399,7 @@ class Driver:
 		if not self.journal_path:
 			self.journal_path = os.path.join(self.workspace, "junit-results.xml")
 
-		self._logger = Logger(self.name, self.journal_path)
+		self._logger = Logger(self.name, self.journal_path, stream = self.streamJournal)
 
 	def _set_os_resources(self):
 		for node in self.targets:
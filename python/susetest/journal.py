@@ -8,7 +8,12 @@
 ##################################################################
 
 import xml.etree.ElementTree as ET
+import tempfile
+import threading
+import queue
 import time
+import os
+import atexit
 from .xmltree import *
 
 # Accepted test states.
@@ -16,6 +21,9 @@ from .xmltree import *
 # by status B.
 VALID_TEST_STATES = ('success', 'warning', 'failure', 'error', 'skipped', 'disabled')
 
+# Timestamps are taken for every event we log
+_now = time.time
+
 __all__ = ['load', 'create']
 
 class TimedNode(XMLBackedNode):
@@ -37,7 +45,7 @@ class JournalEvent(XMLBackedNode):
 	def construct(self, writer = None, **kwargs):
 		super().construct(**kwargs)
 
-		self.timestamp = time.time()
+		self.timestamp = _now()
 
 	@property
 	def eventType(self):
@@ -51,10 +59,13 @@ class JournalMessages(JournalEvent):
 
 	_escape_table = None
 
+	# Messages that have text pieces not yet joined into their node
+	_pending = set()
+
 	def __init__(self, node):
 		super().__init__(node)
-		self._messages = []
 		self.writer = None
+		self._pieces = None
 
 		self._init_escape_table()
 
@@ -73,6 +84,11 @@ class JournalMessages(JournalEvent):
 
 		klass._escape_table = str.maketrans(d)
 
+	# Replace control characters with a printable representation
+	@classmethod
+	def _scrub(klass, text):
+		return text.translate(klass._escape_table)
+
 	def construct(self, writer = None, **kwargs):
 		super().construct(**kwargs)
 
@@ -84,10 +100,27 @@ class JournalMessages(JournalEvent):
 
 	@property
 	def text(self):
+		self._joinPieces()
 		if not self.node.text:
 			return ""
 		return self.node.text.strip()
 
+	# Output often trickles in piece by piece, so write() collects the
+	# pieces and we join them into the node text only when someone
+	# looks at it. Anything that serializes the tree must call
+	# joinAllPieces() first.
+	def _joinPieces(self):
+		pieces = self._pieces
+		if pieces is not None:
+			self.node.text = "\n".join(pieces)
+			self._pieces = None
+			JournalMessages._pending.discard(self)
+
+	@staticmethod
+	def joinAllPieces():
+		for msg in list(JournalMessages._pending):
+			msg._joinPieces()
+
 	def write(self, msg, prefix = None, nodeName = None):
 		# can be None, empty string, empty bytearray...
 		if not msg:
@@ -100,11 +133,15 @@ class JournalMessages(JournalEvent):
 		if type(msg) != str:
 			msg = str(msg)
 
-		self._messages.append(msg)
-		text = "\n".join(self._messages)
-		text = text.translate(self._escape_table)
+		# Only scrub the message we're adding; the ones we already have
+		# have been scrubbed when they were added.
+		pieces = self._pieces
+		if pieces is None:
+			text = self.node.text
+			self._pieces = pieces = [text] if text else []
+			JournalMessages._pending.add(self)
+		pieces.append(self._scrub(msg))
 		# text = f"<![CDATA[{text}]]>"
-		self.node.text = text
 
 		if self.writer:
 			self.writer.logMessage(msg)
@@ -211,39 +248,51 @@ class JournalCommand(JournalEvent):
 
 		self.createChild("status", **kwargs)
 
+	# These return the <stdout>, <stderr> and <chat> children, creating
+	# them on first use. Note that .stdout, .stderr and .chat are None
+	# when the element does not exist, which is what readers rely on.
+	@property
+	def stdoutLog(self):
+		stdout = self.stdout
+		if stdout is None:
+			stdout = self.createChild("stdout")
+		return stdout
+
+	@property
+	def stderrLog(self):
+		stderr = self.stderr
+		if stderr is None:
+			stderr = self.createChild("stderr")
+		return stderr
+
+	@property
+	def chatLog(self):
+		chat = self.chat
+		if chat is None:
+			chat = self.createChild("chat")
+		return chat
+
 	def recordStdout(self, msg):
 		if msg:
-			if not self.stdout:
-				self.stdout = self.createChild("stdout")
-			self.stdout.write(msg)
+			self.stdoutLog.write(msg)
 
 	def recordStderr(self, msg):
 		if msg:
-			if not self.stderr:
-				self.stderr = self.createChild("stderr")
-			self.stderr.write(msg)
+			self.stderrLog.write(msg)
 
 	def recordChatExpectation(self, values):
-		if not self.chat:
-			self.chat = self.createChild("chat")
-		self.chat.setExpect(values)
+		self.chatLog.setExpect(values)
 
 	def recordChatReceived(self, found, stdout):
-		if not self.chat:
-			self.chat = self.createChild("chat")
 		if found is not None:
-			self.chat.createChild("received").write(found)
+			self.chatLog.createChild("received").write(found)
 		self.recordStdout(stdout)
 
 	def recordChatSent(self, msg):
-		if not self.chat:
-			self.chat = self.createChild("chat")
-		self.chat.createChild("sent").write(msg)
+		self.chatLog.createChild("sent").write(msg)
 
 	def recordChatTimeout(self, stdout):
-		if not self.chat:
-			self.chat = self.createChild("chat")
-		self.chat.setError("timeout", "chat command timed out")
+		self.chatLog.setError("timeout", "chat command timed out")
 		self.recordChatReceived(None, stdout)
 
 ##################################################################
@@ -285,22 +334,20 @@ class JournalFileTransfer(JournalEvent):
 		self.createChild("data").write(data)
 
 class JournalLog(XMLBackedNode):
-	# This is a bit special. The reimplementation of addChild() below
-	# makes sure that all children of this node are kept in a single
-	# list (self.events) rather than putting them into one separate list
-	# per child type.
+	# This is a bit special. All children of this node are kept
+	# in a single list (self.events) rather than putting them into
+	# one separate list per child type.
 	children = [
-		ListNodeSchema("info", JournalMessages),
-		ListNodeSchema("failure", JournalMessages),
-		ListNodeSchema("warning", JournalMessages),
-		ListNodeSchema("error", JournalMessages),
-		ListNodeSchema("command", JournalCommand),
-		ListNodeSchema("upload", JournalFileTransfer),
-		ListNodeSchema("download", JournalFileTransfer),
+		ListNodeSchema("info", JournalMessages, attr_name = "events"),
+		ListNodeSchema("failure", JournalMessages, attr_name = "events"),
+		ListNodeSchema("warning", JournalMessages, attr_name = "events"),
+		ListNodeSchema("error", JournalMessages, attr_name = "events"),
+		ListNodeSchema("command", JournalCommand, attr_name = "events"),
+		ListNodeSchema("upload", JournalFileTransfer, attr_name = "events"),
+		ListNodeSchema("download", JournalFileTransfer, attr_name = "events"),
 	]
 
 	def __init__(self, node):
-		self.events = []
 		self.writer = None
 
 		super().__init__(node)
@@ -310,12 +357,6 @@ class JournalLog(XMLBackedNode):
 
 		self.writer = writer
 
-	def addChild(self, type, childObject):
-		if isinstance(childObject, JournalEvent):
-			self.events.append(childObject)
-		else:
-			type._adder(self, childObject)
-
 	def createMessage(self, severity):
 		return self.createChild(severity, writer = self.writer)
 
@@ -355,18 +396,35 @@ class JournalTest(TimedNode):
 		NodeSchema("log", JournalLog),
 	]
 
-	def construct(self, writer = None, **kwargs):
+	writer = None
+	stream = None
+
+	# Set while the contents of this test case live in the stream
+	# writer's spool file rather than in the tree
+	_spooled = False
+
+	def construct(self, writer = None, stream = None, **kwargs):
 		super().construct(**kwargs)
 
-		self.startTime = time.time()
+		self.startTime = _now()
 
 		if writer:
 			writer.beginTestHeading(id = self.test_id, description = self.name)
 		self.writer = writer
+		self.stream = stream
 
 		self.createChild("log", writer = self.writer)
 
+	# Anything written to a test case after it was spooled (such as the
+	# exit status of a backgrounded command) needs the full tree back.
+	def _reopen(self):
+		if self._spooled:
+			self._spooled = False
+			self.stream.unspoolTest(self)
+
 	def setStatus(self, status):
+		self._reopen()
+
 		if status not in VALID_TEST_STATES:
 			self.logMessage(f"invalid test status {status}", severity = 'error')
 			status = 'error'
@@ -379,13 +437,14 @@ class JournalTest(TimedNode):
 			if newPrio < oldPrio:
 				return
 
-		self.time = time.time() - self.startTime
+		self.time = _now() - self.startTime
 		self.status = status
 
 	def logMessage(self, msg, severity = "info", **kwargs):
 		if not msg:
 			return
 
+		self._reopen()
 		m = self.log.createMessage(severity)
 		m.write(msg, **kwargs)
 		return m
@@ -434,6 +493,7 @@ class JournalTest(TimedNode):
 		self.setStatus('disabled')
 
 	def logCommand(self, host, cmdline, **kwargs):
+		self._reopen()
 		cmd = self.log.createCommand(host, cmdline, **kwargs)
 
 		if self.writer:
@@ -463,18 +523,21 @@ class JournalTest(TimedNode):
 		return cmd
 
 	def logCommandContinuation(self, id):
+		self._reopen()
 		return self.log.createCommandContinuation(id)
 
 	def logChatExpect(self, id, values, timeout = None):
 		if type(values) not in (list, tuple):
 			values = [values]
 
+		self._reopen()
 		cmd = self.log.createCommandContinuation(id)
 		cmd.recordChatExpectation(values)
 		if timeout is not None:
 			cmd.timeout = timeout
 
 	def logChatReceived(self, id, found, stdout = None):
+		self._reopen()
 		cmd = self.log.createCommandContinuation(id)
 		cmd.recordChatReceived(found, stdout)
 
@@ -482,16 +545,19 @@ class JournalTest(TimedNode):
 			cmd.recordStdout(stdout)
 
 	def logChatSent(self, id, msg):
+		self._reopen()
 		cmd = self.log.createCommandContinuation(id)
 		cmd.recordChatSent(msg)
 
 	def logUpload(self, host, path, data, **kwargs):
+		self._reopen()
 		xfer = self.log.createUpload(host, path, **kwargs)
 		if data:
 			xfer.recordData(data)
 		return xfer
 
 	def logDownload(self, host, path, data = None, **kwargs):
+		self._reopen()
 		xfer = self.log.createDownload(host, path, **kwargs)
 		if data:
 			xfer.recordData(data)
@@ -509,16 +575,21 @@ class JournalTest(TimedNode):
 		return m
 
 	def complete(self):
-		assert(self.status)
+		status = self.status
+		assert(status)
 
-		if self.writer:
-			if self.status == 'failure':
+		writer = self.writer
+		if writer:
+			if status == 'failure':
 				msg = self.failure.message
-			elif self.status == 'error':
+			elif status == 'error':
 				msg = self.error.message
 			else:
 				msg = None
-			self.writer.logTestResult(self.test_id, self.status, msg)
+			writer.logTestResult(self.test_id, status, msg)
+
+		if self.stream:
+			self.stream.spoolTest(self)
 
 class NodeWithStats(TimedNode):
 	attributes = TimedNode.attributes + [
@@ -600,8 +671,9 @@ class JournalGroup(NodeWithStats):
 	def __init__(self, node):
 		super().__init__(node)
 		self.writer = None
+		self.stream = None
 
-	def construct(self, writer = None, **kwargs):
+	def construct(self, writer = None, stream = None, **kwargs):
 		super().construct(**kwargs)
 
 		self.tests = 0
@@ -609,12 +681,13 @@ class JournalGroup(NodeWithStats):
 		if writer:
 			writer.beginGroupHeading(self.package)
 		self.writer = writer
+		self.stream = stream
 
 	def beginTest(self, name, description):
 		self.tests += 1
 
 		id = f"{self.package}.{name}"
-		return self.createChild("testcase", writer = self.writer, test_id = id, name = description)
+		return self.createChild("testcase", writer = self.writer, stream = self.stream, test_id = id, name = description)
 
 	def finish(self):
 		self.clearStats()
@@ -632,12 +705,13 @@ class JournalRootNode(NodeWithStats):
 		NodeSchema("properties", JournalProperties),
 	]
 
-	def __init__(self, node, name = None, writer = None):
+	def __init__(self, node, name = None, writer = None, stream = None):
 		super().__init__(node)
 
 		if name is not None:
 			self.name = name
 		self.writer = writer
+		self.stream = stream
 
 	def __str__(self):
 		return f"{self.__class__.__name__}(name = {self.name})"
@@ -649,7 +723,7 @@ class JournalRootNode(NodeWithStats):
 
 	def beginGroup(self, name):
 		id = f"{self.name}.{name}"
-		return self.createChild("testsuite", writer = self.writer, package = id)
+		return self.createChild("testsuite", writer = self.writer, stream = self.stream, package = id)
 
 	def finish(self):
 		self.clearStats()
@@ -670,20 +744,40 @@ class JournalRootNode(NodeWithStats):
 		return result
 
 class Journal:
-	def __init__(self, node = None, name = None):
+	def __init__(self, node = None, name = None, stream = False, info = True):
+		self.stream = None
+
+		# When False, callers are expected to not even bother
+		# formatting informational messages
+		self.info_enabled = info
+
 		if node:
 			self.root = JournalRootNode(node)
 			self.writer = None
 		else:
 			writer = StdoutWriter()
 
+			if stream:
+				self.stream = JournalStreamWriter()
+
 			if not name:
 				name = "report"
 			node = ET.Element("twopence-report")
-			self.root = JournalRootNode(node, name, writer)
+			self.root = JournalRootNode(node, name, writer, self.stream)
 
 	def save(self, filename):
-		self.root.save(filename)
+		JournalMessages.joinAllPieces()
+		if self.stream:
+			self.stream.save(self.root, filename)
+		else:
+			self.root.save(filename)
+
+	# Release the spool file of a streaming journal. The journal
+	# cannot be saved after this.
+	def close(self):
+		if self.stream:
+			self.stream.close()
+			self.stream = None
 
 	def addProperty(self, key, value):
 		self.root.addProperty(key, value)
@@ -695,6 +789,155 @@ class Journal:
 	def finish(self):
 		self.root.finish()
 
+##################################################################
+# For long test runs, we do not want to keep the complete log of
+# every test case in memory until the very end.
+# When a test case completes, the stream writer serializes it
+# to a spool file and drops everything but the test's attributes
+# from the in-memory tree. save() then writes the document,
+# copying the spooled test cases back in place.
+#
+# The actual writing to the spool file happens in a background
+# thread, so that the test run does not wait for the disk. That
+# thread is a daemon, so we drain its queue at exit; otherwise a
+# journal saved during interpreter shutdown (eg from Driver.__del__)
+# would be missing the last test cases.
+##################################################################
+class JournalStreamWriter:
+	# Elements that may contain spooled test cases
+	containers = ('twopence-report', 'testsuite')
+
+	def __init__(self):
+		self.spool = tempfile.TemporaryFile()
+		self._extents = {}
+		self._offset = 0
+		self._queue = queue.SimpleQueue()
+		self._thread = None
+		self._error = None
+
+		atexit.register(self.flush)
+
+	def spoolTest(self, test):
+		node = test.node
+
+		JournalMessages.joinAllPieces()
+
+		# The test case goes at depth 2, below <twopence-report> and <testsuite>
+		if getattr(ET, 'indent', None):
+			ET.indent(node, level = 2)
+		node.tail = None
+
+		data = ET.tostring(node, encoding = "utf-8")
+		self._extents[node] = (self._offset, len(data))
+		self._offset += len(data)
+
+		if self._thread is None:
+			self._thread = threading.Thread(target = self._drain, daemon = True)
+			self._thread.start()
+		self._queue.put(data)
+
+		attrib = dict(node.attrib)
+		node.clear()
+		node.attrib.update(attrib)
+
+		# Drop the python objects wrapping the children we just removed
+		for type in test._children.values():
+			type._initer(test)
+		test._spooled = True
+
+	# Bring a spooled test case back into the tree, because someone
+	# wants to add to it. It stays in memory from now on, and save()
+	# writes it out from the tree like any other element.
+	def unspoolTest(self, test):
+		node = test.node
+
+		extent = self._extents.pop(node, None)
+		if extent is None:
+			return
+
+		# Make sure the background thread has written it
+		self.flush()
+
+		offset, length = extent
+		self.spool.seek(offset)
+		saved = ET.fromstring(self.spool.read(length))
+		self.spool.seek(0, os.SEEK_END)
+
+		node.text = saved.text
+		node.extend(list(saved))
+
+		for type in test._children.values():
+			type._initer(test)
+		for child in node:
+			test._dispatch_child(child)
+
+		# The reloaded <log> does not know where to echo new messages
+		if test.log is not None:
+			test.log.writer = test.writer
+
+	def _drain(self):
+		while True:
+			data = self._queue.get()
+			if data is None:
+				break
+
+			if self._error is None:
+				try:
+					self.spool.write(data)
+				except Exception as e:
+					self._error = e
+
+	# Wait for the background thread to write everything we queued
+	def flush(self):
+		if self._thread is not None:
+			self._queue.put(None)
+			self._thread.join()
+			self._thread = None
+
+		if self._error is not None:
+			raise self._error
+
+	def save(self, root, filename):
+		self.flush()
+
+		with replaceFile(filename) as out:
+			out.write(b"<?xml version='1.0' encoding='UTF-8'?>\n")
+			self._write(out, root.node, 0)
+
+	def close(self):
+		atexit.unregister(self.flush)
+		try:
+			self.flush()
+		finally:
+			self.spool.close()
+
+	def _write(self, out, node, depth):
+		indent = b"\n" + depth * b"  "
+		if depth:
+			out.write(indent)
+
+		extent = self._extents.get(node)
+		if extent is not None:
+			offset, length = extent
+			self.spool.seek(offset)
+			out.write(self.spool.read(length))
+			self.spool.seek(0, os.SEEK_END)
+		elif node.tag in self.containers:
+			attrs = "".join(f" {name}={quoteAttribute(value)}" for name, value in node.attrib.items())
+			if len(node) == 0:
+				out.write(f"<{node.tag}{attrs} />".encode("utf-8"))
+				return
+
+			out.write(f"<{node.tag}{attrs}>".encode("utf-8"))
+			for child in node:
+				self._write(out, child, depth + 1)
+			out.write(indent + f"</{node.tag}>".encode("utf-8"))
+		else:
+			if getattr(ET, 'indent', None):
+				ET.indent(node, level = depth)
+			node.tail = None
+			out.write(ET.tostring(node, encoding = "utf-8"))
+
 class StdoutWriter:
 	def hrule(self):
 		print("------------------------------------------------------------------")
@@ -768,18 +1011,44 @@ class StdoutWriter:
 # while hiding the details of how stuff is organized.
 ##################################################################
 class WrappedNode:
-	def __init__(self, node, klass):
-		for type in klass.attributes:
-			value = getattr(node, type.attr_name, None)
-			setattr(self, type.attr_name, value)
+	# The XMLBackedNode class whose attributes we copy
+	nodeClass = None
+
+	def __init__(self, node):
+		self._copy_attributes(node)
+
+	def _copy_attributes(self, node):
+		pass
+
+	# Rather than looping over the attribute schema for every wrapper
+	# we create, compile a function that copies the attributes one by one.
+	def __init_subclass__(klass, **kwargs):
+		super().__init_subclass__(**kwargs)
+
+		# Intermediate wrapper classes may not name a node class (yet)
+		if klass.nodeClass is None:
+			return
+
+		lines = ["def _copy_attributes(self, node):"]
+		for type in klass.nodeClass.attributes:
+			lines.append(f"	self.{type.attr_name} = node.{type.attr_name}")
+		if len(lines) == 1:
+			lines.append("	pass")
+
+		namespace = {}
+		code = compile("\n".join(lines), f"<{klass.__name__}._copy_attributes>", "exec")
+		exec(code, namespace)
+
+		klass._copy_attributes = namespace['_copy_attributes']
 
 class StatsWrapper(WrappedNode):
-	def __init__(self, nodeWithStats):
-		super().__init__(nodeWithStats, NodeWithStats)
+	nodeClass = NodeWithStats
 
 class MessagesWrapper(WrappedNode):
+	nodeClass = JournalMessages
+
 	def __init__(self, node):
-		super().__init__(node, JournalMessages)
+		super().__init__(node)
 		self.text = node.text
 
 	def __str__(self):
@@ -854,8 +1123,8 @@ def load(path):
 	
 	raise ValueError(f"{path} does not look like a test report we can handle.")
 
-def create(name):
-	return Journal(name = name)
+def create(name, stream = False, info = True):
+	return Journal(name = name, stream = stream, info = info)
 
 def dump(journal):
 	print(journal.root)
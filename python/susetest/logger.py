@@ -7,38 +7,84 @@
 ##################################################################
 
 import susetest
+import twopence
+import sys
+import os
+import weakref
+import functools
+import collections
 from .xmltree import XMLTree
 
 from .journal import load as loadJournal
 from .journal import create as createJournal
+from .journal import JournalTest
 from .xmltree import *
 
+def _noHooks():
+	pass
+
+def _discardMessage(message):
+	pass
+
+# Host and user names repeat throughout a journal; have all the
+# elements share one copy of each
+def _intern(value):
+	if type(value) is str:
+		return sys.intern(value)
+	return value
+
+# Hooks are usually registered during setup and then run after every
+# single test case. So rather than walking a list each time, we compose
+# a runner on first use, and throw it away whenever a hook is added.
 class TestLoggerHooks:
+	__slots__ = ('_postTestHooks', 'runPostTestHooks')
+
 	def __init__(self):
 		self._postTestHooks = []
+		self.runPostTestHooks = self._freezePostTestHooks
 
 	def addPostTestHook(self, fn):
 		self._postTestHooks.append(fn)
+		self.runPostTestHooks = self._freezePostTestHooks
+
+	def _freezePostTestHooks(self):
+		hooks = tuple(self._postTestHooks)
+		if not hooks:
+			runner = _noHooks
+		elif len(hooks) == 1:
+			runner = hooks[0]
+		else:
+			def runner():
+				for fn in hooks:
+					fn()
 
-	def runPostTestHooks(self):
-		for fn in self._postTestHooks:
-			fn()
+		self.runPostTestHooks = runner
+		runner()
 
 class GroupLogger:
-	def __init__(self, journal, hooks, name, global_resources = None):
+	__slots__ = ('_name', '_journal', '_group', '_hooks', '_logger', '_currentTest', '_active',
+			'_failures', '_errors', '__weakref__')
+
+	# logger is a weak reference to the owning Logger
+	def __init__(self, journal, hooks, name, logger = None):
 		self._name = name
 		self._journal = journal
 		self._group = journal.beginGroup(name)
 		self._hooks = hooks
+		self._logger = logger
 
 		self._currentTest = None
-		self.global_resources = global_resources
 
-		assert(not global_resources)
+		# These are updated by TestLogger.end()
+		self._failures = 0
+		self._errors = 0
 
 		self._active = True
 
-	def __del__(self):
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
 		self.end()
 
 	@property
@@ -57,20 +103,41 @@ class GroupLogger:
 			self.endTest()
 			self._active = False
 
+	# Deactivate the group without ending its current test. This is
+	# for closing the logger in the middle of a test (eg after an
+	# exception); rather than recording a success, we leave the test
+	# without a result so that the journal flags it as an error.
+	def abandon(self):
+		test = self._currentTest
+		if test:
+			test._active = False
+
+			logger = self._logger and self._logger()
+			if logger:
+				logger._unbindTest(test)
+			self._currentTest = None
+
+		self._active = False
+
 	@property
 	def errors(self):
-		raise NotImplementedError()
+		return self._errors
 
 	@property
 	def failures(self):
-		raise NotImplementedError()
+		return self._failures
 
 	def beginTest(self, *args, **kwargs):
-		self.endTest()
+		if self._currentTest is not None:
+			self.endTest()
 
-		test = TestLogger(self._group, self._hooks, *args, **kwargs)
+		test = TestLogger(self, *args, **kwargs)
 		self._currentTest = test
 
+		logger = self._logger and self._logger()
+		if logger:
+			logger._bindTest(test)
+
 		return test
 
 	def endTest(self):
@@ -85,68 +152,119 @@ class GroupLogger:
 			self._currentTest = None
 
 class TestLogger:
+	__slots__ = ('_group', '_hooks', '_logger', '_test', '_active', '_infoEnabled', '_predict', '_predictReason', '_predictionArrived')
+
+	# Outcomes carry no per-test state, so all test loggers share the
+	# same two instances. log is the JournalTest method to call.
 	class Outcome:
+		__slots__ = ('noun', 'log')
+
 		def __init__(self, noun, logfn):
 			self.noun = noun
 			self.log = logfn
 
-			self.reason = None
-
 		def __str__(self):
 			return self.noun
 
-	def __init__(self, group, hooks, name, *args, **kwargs):
-		self._hooks = hooks
+	outcomeFailure = Outcome("failure", JournalTest.logFailure)
+	outcomeError = Outcome("error", JournalTest.logError)
+
+	# Maps the predicted status to the outcome describing it
+	_predictMap = {
+		'failure':	outcomeFailure,
+		'error':	outcomeError,
+	}
 
-		self._test = group.beginTest(name, *args, **kwargs)
+	# group is the GroupLogger this test case belongs to. We only hold
+	# a weak reference to it, so that the group and its current test
+	# do not keep each other alive.
+	def __init__(self, group, name, *args, **kwargs):
+		self._group = weakref.ref(group)
+		self._hooks = group._hooks
+		self._logger = logger = group._logger
+
+		self._test = group._group.beginTest(name, *args, **kwargs)
 		self._active = True
 
+		logger = logger and logger()
+		self._infoEnabled = logger is None or logger.infoEnabled
+
 		self._predict = None
+		self._predictReason = None
 		self._predictionArrived = False
 
-		self.outcomeFailure = self.Outcome("failure", self._test.logFailure)
-		self.outcomeError = self.Outcome("error", self._test.logError)
-
-
 	def __bool__(self):
 		return self._active
 
+	@property
+	def infoEnabled(self):
+		return self._infoEnabled
+
 	def end(self):
 		if not self._active:
 			return
 
 		self._hooks.runPostTestHooks()
 
-		if self._test.status is None:
-			if self._predict and not self._predictionArrived:
-				self._test.logFailure(f"*** Expected {self._predict.noun} ({self._predict.reason}) - but the test apparently succeeded")
+		test = self._test
+		status = test.status
+		if status is None:
+			predict = self._predict
+			if predict and not self._predictionArrived:
+				test.logFailure(f"*** Expected {predict.noun} ({self._predictReason}) - but the test apparently succeeded")
 			else:
-				self._test.logSuccess()
+				test.logSuccess()
+			status = test.status
 
-		self._test.complete()
+		test.complete()
 		self._active = False
 
+		group = self._group()
+		if group is not None:
+			if status == 'failure':
+				group._failures += 1
+			elif status == 'error':
+				group._errors += 1
+
+		logger = self._logger and self._logger()
+		if logger:
+			logger._unbindTest(self)
+
 	# mark the test as being skipped
 	def skip(self, msg = None):
 		self._test.logSkipped(msg)
 		self.end()
 
 	def logInfo(self, message):
-		self._test.logInfo(message)
+		if self._infoEnabled:
+			self._test.logInfo(message)
 
+	# Do not bother formatting informational messages if the
+	# journal is going to discard them anyway
 	def logOutcome(self, outcome, message):
-		if self._predict is outcome:
-			if not self._predictionArrived:
-				self.logInfo(f"*** Encountering expected {outcome.noun} of test case")
-				self._predictionArrived = True
-			self.logInfo(f"Expected {outcome.noun}: {message}")
+		test = self._test
+
+		# Most test cases do not come with a prediction
+		predict = self._predict
+		if predict is None:
+			outcome.log(test, message)
+			return
+
+		if predict is outcome:
+			if self._infoEnabled:
+				noun = outcome.noun
+				if not self._predictionArrived:
+					test.logInfo(f"*** Encountering expected {noun} of test case")
+				test.logInfo(f"Expected {noun}: {message}")
+			self._predictionArrived = True
 			return
 
-		if self._predict and not self._predictionArrived:
-			self.logInfo("*** Encountering unpredicted {outcome.noun} of test case (expected {self._predict.noun})")
+		if not self._predictionArrived:
+			if self._infoEnabled:
+				test.logInfo(f"*** Encountering unpredicted {outcome.noun} of test case (expected {predict.noun})")
 			self._predictionArrived = True
 
-		outcome.log(message)
+		outcome.log(test, message)
 
 	def logFailure(self, message):
 		self.logOutcome(self.outcomeFailure, message)
@@ -155,18 +273,13 @@ class TestLogger:
 		self.logOutcome(self.outcomeError, message)
 
 	# cmd is a twopence.Command instance
+	# Attributes that are None are simply not added to the journal
 	def logCommand(self, host, cmd):
-		kwargs = {}
-		if cmd.user:
-			kwargs['user'] = cmd.user
-		if cmd.timeout:
-			kwargs['timeout'] = cmd.timeout
-		if cmd.background:
-			kwargs['background'] = cmd.background
-		if cmd.tty:
-			kwargs['tty'] = cmd.tty
-
-		logHandle = self._test.logCommand(host, cmdline = cmd.commandline, **kwargs)
+		logHandle = self._test.logCommand(_intern(host), cmdline = cmd.commandline,
+					user = _intern(cmd.user) or None,
+					timeout = cmd.timeout or None,
+					background = cmd.background or None,
+					tty = cmd.tty or None)
 
 		# FIXME: if the caller set an environment, enter it into the log here
 		if cmd.environ:
@@ -186,14 +299,18 @@ class TestLogger:
 		else:
 			logHandle.recordStatus(exit_code = st.exitStatus)
 
-		logHandle.recordStdout(st.stdout)
-		if st.stderr != st.stdout:
-			logHandle.recordStderr(st.stderr)
+		stdout = st.stdout
+		if stdout:
+			logHandle.recordStdout(stdout)
 
-		# Status.buffer is just for file transfers
-		assert(not st.buffer)
+		# twopence often hands us the very same buffer for both
+		stderr = st.stderr
+		if stderr and stderr is not stdout and stderr != stdout:
+			logHandle.recordStderr(stderr)
 
 	class ProcessWithPaperTrail:
+		__slots__ = ('logger', 'test', 'id', 'process')
+
 		def __init__(self, logger, test, id, process):
 			self.logger = logger
 			self.test = test
@@ -223,6 +340,8 @@ class TestLogger:
 		return self.ProcessWithPaperTrail(self, self._test, logHandle.id, process)
 
 	class ChatWithPaperTrail(ProcessWithPaperTrail):
+		__slots__ = ()
+
 		@property
 		def found(self):
 			return self.process.found
@@ -238,18 +357,21 @@ class TestLogger:
 		def expect(self, values, **kwargs):
 			logHandle = self.commandContinuation
 
-			if type(values) not in (list, tuple):
+			if not isinstance(values, (list, tuple)):
 				values = [values]
 
 			logHandle.recordChatExpectation(values)
-			if 'timeout' in kwargs:
-				logHandle.timeout = kwargs['timeout']
 
-			found = self.process.expect(values, **kwargs)
+			timeout = kwargs.get('timeout')
+			if timeout is not None:
+				logHandle.timeout = timeout
+
+			process = self.process
+			found = process.expect(values, **kwargs)
 			if found:
-				logHandle.recordChatReceived(self.found, self.consumed)
+				logHandle.recordChatReceived(process.found, process.consumed)
 			else:
-				logHandle.recordChatTimeout(self.consumed)
+				logHandle.recordChatTimeout(process.consumed)
 
 			return found
 
@@ -263,27 +385,18 @@ class TestLogger:
 		return self.ChatWithPaperTrail(self, self._test, logHandle.id, chat)
 
 	def logUpload(self, host, xfer, hideData = False):
-		kwargs = {}
-		if xfer.user:
-			kwargs['user'] = xfer.user
-		if xfer.timeout:
-			kwargs['timeout'] = xfer.timeout
-		if xfer.data:
-			kwargs['data'] = xfer.data
-		kwargs['hideData'] = hideData
-
-		return self._test.logUpload(host, xfer.remotefile, **kwargs)
+		return self._test.logUpload(_intern(host), xfer.remotefile,
+					data = xfer.data or None,
+					hideData = hideData,
+					user = _intern(xfer.user) or None,
+					timeout = xfer.timeout or None)
 
 
 	def logDownload(self, host, xfer, hideData = False):
-		kwargs = {}
-		if xfer.user:
-			kwargs['user'] = xfer.user
-		if xfer.timeout:
-			kwargs['timeout'] = xfer.timeout
-		kwargs['hideData'] = hideData
-
-		return self._test.logDownload(host, xfer.remotefile, **kwargs)
+		return self._test.logDownload(_intern(host), xfer.remotefile,
+					hideData = hideData,
+					user = _intern(xfer.user) or None,
+					timeout = xfer.timeout or None)
 
 	# logHandle is the handle returned by logUpload/Download above;
 	# st is a twopence.Status instance
@@ -294,19 +407,18 @@ class TestLogger:
 			logHandle.recordData(st.buffer)
 
 	def setPredictedOutcome(self, status, reason):
-		if status == 'failure':
-			outcome = self.outcomeFailure
-		elif status == 'error':
-			outcome = self.outcomeError
-		else:
+		try:
+			outcome = self._predictMap[status]
+		except KeyError:
 			raise ValueError(f"Cannot handle unknown prediction {status}")
 
 		if self._predict is not None and self._predict is not outcome:
 			self.logError(f"Cassandra is confused: conflicting predictions {self._predict} vs {status}")
 			return
 
-		self.logInfo(f"*** Setting the predicted outcome of this test case to {status}: {reason}")
-		outcome.reason = reason
+		if self._infoEnabled:
+			self._test.logInfo(f"*** Setting the predicted outcome of this test case to {status}: {reason}")
+		self._predictReason = reason
 		self._predict = outcome
 
 	@property
@@ -319,23 +431,55 @@ class TestLogger:
 		return self._test.createSecurityViolation(*args, **kwargs)
 
 class Logger:
-	def __init__(self, name, path):
+	__slots__ = ('_journal', '_path', '_hooks', '_currentGroup', '_boundTest',
+			'_logInfo', '_logFailure', '_logError', '_lostWarned', '_dirty', '__weakref__')
+
+	# With stream = True, completed test cases are spooled to a temporary
+	# file rather than kept in memory until close() writes the journal.
+	# Setting SUSETEST_LOG_LEVEL to something other than info or debug
+	# drops all informational messages from the journal.
+	def __init__(self, name, path, stream = False):
 		susetest.say(f"Writing journal to {path}")
 
-		self._journal = createJournal(name)
+		level = os.getenv("SUSETEST_LOG_LEVEL", "info")
+		self._journal = createJournal(name, stream = stream, info = level in ('info', 'debug'))
 		self._path = path
 		self._hooks = TestLoggerHooks()
 
 		self._currentGroup = None
+		self._dirty = False
+		self._lostWarned = set()
+		self._bindTest(None)
+
+	def __enter__(self):
+		return self
 
-	def __del__(self):
+	def __exit__(self, *exc_info):
 		self.close()
 
+	@property
+	def infoEnabled(self):
+		return self._journal is not None and self._journal.info_enabled
+
+	# There is no destructor to clean up after us; whoever creates
+	# the Logger is expected to close it (or use it as a context manager)
+	# We always write the journal, because the caller will want to look
+	# at it. But there's no point in computing statistics and
+	# reporting them if no test group was ever started.
 	def close(self):
-		if self._journal:
-			self._journal.finish()
-			self._journal.save(self._path)
-			self._journal = None
+		journal = self._journal
+		if journal:
+			try:
+				if self._dirty:
+					group = self._currentGroup
+					if group:
+						self._currentGroup = None
+						group.abandon()
+					journal.finish()
+				journal.save(self._path)
+			finally:
+				journal.close()
+				self._journal = None
 
 	def addPostTestHook(self, fn):
 		self._hooks.addPostTestHook(fn)
@@ -352,11 +496,13 @@ class Logger:
 		return None
 
 	def beginGroup(self, name):
-		if self._currentGroup is not None:
-			self.endGroup()
+		group = self._currentGroup
+		if group:
+			group.end()
 
-		group = GroupLogger(self._journal, self._hooks, name)
+		group = GroupLogger(self._journal, self._hooks, name, logger = weakref.ref(self))
 		self._currentGroup = group
+		self._dirty = True
 
 		return group
 
@@ -374,29 +520,45 @@ class Logger:
 		susetest.say("FATAL " + message)
 		self._journal.fatal(message)
 
-	def logInfo(self, message):
-		test = self.currentTest
-		if not test:
-			print(f"*** Calling logInfo outside of a test case - message will be LOST: {message}")
+	# Rather than looking up the current group and test case on every
+	# call to logInfo() and friends, the group logger tells us when a
+	# test case begins, and the test logger tells us when it ends.
+	def _bindTest(self, test):
+		self._boundTest = test
+		if test is None:
+			self._logInfo = functools.partial(self._lostMessage, "logInfo")
+			self._logFailure = functools.partial(self._lostMessage, "logFailure")
+			self._logError = functools.partial(self._lostMessage, "logError")
+		else:
+			if self.infoEnabled:
+				self._logInfo = test.logInfo
+			else:
+				self._logInfo = _discardMessage
+			self._logFailure = test.logFailure
+			self._logError = test.logError
+
+	def _unbindTest(self, test):
+		if self._boundTest is test:
+			self._bindTest(None)
+
+	# Messages logged while there is no active test case go nowhere.
+	# Complain about this once for each kind of message, not for every
+	# single one of them.
+	def _lostMessage(self, kind, message):
+		if kind in self._lostWarned:
 			return
 
-		test.logInfo(message)
+		self._lostWarned.add(kind)
+		print(f"*** Calling {kind} outside of a test case - message will be LOST: {message}")
 
-	def logFailure(self, message):
-		test = self.currentTest
-		if not test:
-			print(f"*** Calling logFailure outside of a test case - message will be LOST: {message}")
-			return
+	def logInfo(self, message):
+		self._logInfo(message)
 
-		test.logFailure(message)
+	def logFailure(self, message):
+		self._logFailure(message)
 
 	def logError(self, message):
-		test = self.currentTest
-		if not test:
-			print(f"*** Calling logError outside of a test case - message will be LOST: {message}")
-			return
-
-		test.logError(message)
+		self._logError(message)
 
 	def logCommand(self, host, cmd):
 		return self.currentTest.logCommand(host, cmd)
@@ -442,8 +604,9 @@ class InfoInvocation(XMLBackedNode):
 	def __str__(self):
 		return self.node.text
 
+	# No need to escape anything here; ElementTree takes care of
+	# that when the document is written
 	def set(self, value):
-		# FIXME: escape processing
 		self.node.text = value
 
 class InfoParameter(XMLBackedNode):
@@ -457,27 +620,45 @@ class InfoParameterSet(XMLBackedNode):
 		ListNodeSchema("parameter", InfoParameter),
 	]
 
+	# The parameters are kept in a dict alongside the XML nodes, so that
+	# asDict() does not have to walk the nodes. Note that self.parameter
+	# only covers the parameters we loaded, not those added later.
+	def __init__(self, node):
+		super().__init__(node)
+
+		self._values = {p.node.get('name'): p.node.get('value') for p in self.parameter}
+
 	def asDict(self):
-		result = {}
-		for p in self.parameter:
-			result[p.name] = p.value
-		return result
+		# Callers are free to modify what we return
+		return dict(self._values)
 
 	def add(self, name, value):
-		child = self.createChild("parameter", name = name, value = value)
+		self.update({name: value})
 
 	def update(self, parameters):
+		Element = ET.Element
+		values = self._values
+
+		elements = []
 		for name, value in parameters.items():
-			self.add(name, value)
+			attrib = {}
+			if name is not None:
+				name = attrib['name'] = str(name)
+			if value is not None:
+				value = attrib['value'] = str(value)
+			elements.append(Element("parameter", attrib))
+			values[name] = value
+
+		self.node.extend(elements)
 
 class InfoRole(XMLBackedNode):
 	attributes = [
 		AttributeSchema("name"),
-		AttributeSchema("os"),
-		AttributeSchema("vendor"),
-		AttributeSchema("platform"),
-		AttributeSchema("application"),
-		AttributeSchema("base-platform"),
+		InternedAttributeSchema("os"),
+		InternedAttributeSchema("vendor"),
+		InternedAttributeSchema("platform"),
+		InternedAttributeSchema("application"),
+		InternedAttributeSchema("base-platform"),
 		AttributeSchema("base-image"),
 		AttributeSchema("build-timestamp"),
 	]
@@ -495,11 +676,14 @@ class InfoRoleSet(XMLBackedNode):
 
 class TestResult(XMLBackedNode):
 	attributes = [
-		AttributeSchema("status"),
+		InternedAttributeSchema("status"),
 		AttributeSchema("id"),
 		AttributeSchema("description"),
 	]
 
+# What ResultsVectorDocument.results hands out to readers
+TestResultInfo = collections.namedtuple("TestResultInfo", "id status description")
+
 class ResultsDocument(XMLBackedNode):
 	attributes = [
 		AttributeSchema("name"),
@@ -544,16 +728,33 @@ class ResultsVectorDocument(ResultsDocument):
 			return self._parameters.asDict()
 		return {}
 
+	# Results can number in the thousands, so add them as plain elements
+	# rather than creating a TestResult object for each of them.
 	def addResults(self, results):
-		for test in results:
-			self.createChild("test",
-					id = test.id,
-					status = test.status,
-					description = test.description)
+		Element = ET.Element
 
+		elements = []
+		for test in results:
+			attrib = {}
+			if test.id is not None:
+				attrib['id'] = str(test.id)
+			if test.status is not None:
+				attrib['status'] = sys.intern(str(test.status))
+			if test.description is not None:
+				attrib['description'] = str(test.description)
+			elements.append(Element("test", attrib))
+
+		self.node.extend(elements)
+
+	# Readers only look at id, status and description, so give them a
+	# tuple built straight from the node's attributes rather than going
+	# through the TestResult property getters for each of them.
+	# Note that self.test only covers the results we loaded, not
+	# those added by addResults().
 	@property
 	def results(self):
-		return self.test
+		return [TestResultInfo(child.get('id'), child.get('status'), child.get('description'))
+				for child in self.node.iterfind("test")]
 
 class ResultsMatrixDocument(ResultsDocument):
 	children = [
@@ -567,31 +768,38 @@ class ResultsMatrixDocument(ResultsDocument):
 	def createColumn(self, name = None):
 		return self.createChild("vector", name = name)
 
+_resultsDocumentTypes = {
+	'matrix':	ResultsMatrixDocument,
+	'vector':	ResultsVectorDocument,
+}
+
 def loadResultsDocument(path):
+	# Look at the root element before parsing the rest of the file, so that
+	# we do not build a complete tree for something we cannot handle anyway.
 	try:
-		tree = ET.parse(path)
-	except Exception as e:
-		error(f"Unable to parse results document {path}: {e}")
-		return False
-
-	root = tree.getroot()
-	if root.tag == 'results' and root.attrib.get('type') == 'matrix':
-		return ResultsMatrixDocument(root)
-
-	if root.tag == 'results' and root.attrib.get('type') == 'vector':
-		return ResultsVectorDocument(root)
+		with open(path, 'rb') as f:
+			events = ET.iterparse(f, events = ('start', ))
+			event, root = next(events)
+
+			klass = None
+			if root.tag == 'results':
+				klass = _resultsDocumentTypes.get(root.attrib.get('type'))
+			if klass is None:
+				raise ValueError(f"{path} does not look like a results document we can handle.")
+
+			# Parse the remainder of the document without looking at it
+			collections.deque(events, maxlen = 0)
+	except (OSError, ET.ParseError) as e:
+		twopence.error(f"Unable to parse results document {path}: {e}")
+		return None
 
-	raise ValueError(f"{path} does not look like a results document we can handle.")
+	return klass(root)
 
 def createResultsDocument(type):
-	root = ET.Element("results")
-
-	if type == "matrix":
-		doc = ResultsMatrixDocument(root)
-	elif type == "vector":
-		doc = ResultsVectorDocument(root)
-	else:
+	klass = _resultsDocumentTypes.get(type)
+	if klass is None:
 		raise ValueError(f"Don't know how to create results document for type \"{type}\"")
 
+	doc = klass(ET.Element("results"))
 	doc.type = type
 	return doc
@@ -14,25 +14,127 @@ import susetest
 
 from .feature import Feature
 
+# The individual package managers differ only in the commands they
+# run, so they just provide command templates.
 class PackageManager(Feature):
+	checkCommand = None
+	listCommand = None
+	installCommand = None
+	installTimeout = 120
+
+	def __init__(self):
+		super().__init__()
+
+		# (node name, package name) pairs we know to be installed
+		self._installed = set()
+
+		# names of nodes whose package list we have already loaded
+		self._listed = set()
+
 	def run(self, node, cmd, **kwargs):
 		st = node.run(cmd, user = "root", **kwargs)
 		if not st:
 			node.logInfo(f"{cmd} failed: {st.message}")
 		return bool(st)
 
-class PackageManagerRPM(PackageManager):
+	# Several resources often depend on the same package; there's no
+	# point in asking the node again once we know it's there.
 	def checkPackage(self, node, packageName):
-		return self.run(node, f"rpm -q {packageName}")
+		key = (node.name, packageName)
+		if key in self._installed:
+			return True
 
-class PackageManagerZypper(PackageManagerRPM):
-	name = "zypper"
+		if self.loadPackageList(node) and key in self._installed:
+			return True
+
+		if not self.run(node, self.checkCommand % packageName):
+			return False
+
+		self._installed.add(key)
+		return True
 
 	def installPackage(self, node, packageName):
-		return self.run(node, f"zypper install -y {packageName}", timeout = 120)
+		if not self.run(node, self.installCommand % packageName, timeout = self.installTimeout):
+			return False
+
+		self._installed.add((node.name, packageName))
+		return True
+
+	# Check a whole list of packages with a single command, and return
+	# the ones that are not installed (or None if we cannot tell).
+	def checkPackages(self, node, packageNames):
+		self.loadPackageList(node)
+
+		unknown = [name for name in packageNames if (node.name, name) not in self._installed]
+		if not unknown:
+			return []
+
+		st = node.run(self.checkCommand % " ".join(unknown), user = "root", quiet = True, stdout = bytearray())
+		if st:
+			missing = []
+		else:
+			missing = self.parseMissingPackages(st, unknown)
+			if missing is None:
+				return None
+
+		for name in unknown:
+			if name not in missing:
+				self._installed.add((node.name, name))
+		return missing
+
+	# Fetch the names of all installed packages once per node, so that
+	# most checks do not have to talk to the node at all. Packages not
+	# in the list are still checked individually, as the check command
+	# may accept more than plain package names.
+	def loadPackageList(self, node):
+		if self.listCommand is None:
+			return False
+
+		if node.name not in self._listed:
+			self._listed.add(node.name)
+
+			st = node.run(self.listCommand, user = "root", quiet = True, stdout = bytearray())
+			if st:
+				for name in st.stdoutString.split():
+					self._installed.add((node.name, name))
+
+		return True
+
+	# Given the failed status of a check command for several packages,
+	# figure out which of them are missing. Return None if we can't tell.
+	def parseMissingPackages(self, st, packageNames):
+		return None
+
+	def installPackages(self, node, packageNames):
+		cmd = self.installCommand % " ".join(packageNames)
+		if not self.run(node, cmd, timeout = self.installTimeout * len(packageNames)):
+			return False
+
+		for name in packageNames:
+			self._installed.add((node.name, name))
+		return True
+
+class PackageManagerRPM(PackageManager):
+	checkCommand = "rpm -q %s"
+	listCommand = "rpm -qa --qf '%{NAME}\\n'"
+
+	# rpm -q prints one line per package, in the order given on
+	# the command line.
+	def parseMissingPackages(self, st, packageNames):
+		lines = st.stdoutString.strip().split("\n")
+		if len(lines) != len(packageNames):
+			return None
+
+		missing = []
+		for name, line in zip(packageNames, lines):
+			if line == f"package {name} is not installed":
+				missing.append(name)
+		return missing
+
+class PackageManagerZypper(PackageManagerRPM):
+	name = "zypper"
+	installCommand = "zypper install -y %s"
 
 class PackageManagerDNF(PackageManagerRPM):
 	name = "dnf"
-
-	def installPackage(self, node, packageName):
-		return self.run(node, f"dnf -y install {packageName}", timeout = 120)
+	installCommand = "dnf -y install %s"
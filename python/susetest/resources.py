@@ -114,7 +114,9 @@ import curly
 import sys
 import re
 import crypt
-import functools
+import itertools
+import collections
+import copy
 import twopence
 from twopence.schema import *
 from twopence.provision.util import NameVersionCheck, NameVersion
@@ -238,9 +240,11 @@ class ResourceConditional:
 	class AndOr:
 		def __init__(self, clauses = None):
 			self.clauses = clauses or []
+			self._evals = None
 
 		def add(self, term):
 			self.clauses.append(term)
+			self._evals = None
 
 		def _dump(self):
 			return (term.dump() for term in self.clauses)
@@ -248,12 +252,24 @@ class ResourceConditional:
 		def eval_all(self, context):
 			return (term.eval(context) for term in self.clauses)
 
+		# Conditionals are evaluated over and over for every resource,
+		# so bind the eval methods of our clauses just once.
+		def _compile(self):
+			self._evals = tuple(term.eval for term in self.clauses)
+			return self._evals
+
 	class AND(AndOr):
 		def dump(self):
 			return " AND ".join(self._dump())
 
 		def eval(self, context):
-			return all(self.eval_all(context))
+			evals = self._evals
+			if evals is None:
+				evals = self._compile()
+			for fn in evals:
+				if not fn(context):
+					return False
+			return True
 
 	class OR(AndOr):
 		def dump(self):
@@ -261,7 +277,13 @@ class ResourceConditional:
 			return " OR ".join(terms)
 
 		def eval(self, context):
-			return any(self.eval_all(context))
+			evals = self._evals
+			if evals is None:
+				evals = self._compile()
+			for fn in evals:
+				if fn(context):
+					return True
+			return False
 
 	class NOT:
 		def __init__(self, term):
@@ -287,10 +309,17 @@ class ResourceConditional:
 				term.add(klass.fromConfig(child, klass.OR))
 			elif child.type == 'not':
 				test = klass.fromConfig(child)
-				term.add(klass.NOT(test))
+				if isinstance(test, klass.NOT):
+					term.add(test.term)
+				else:
+					term.add(klass.NOT(test))
 			else:
 				raise BadConditional(f"{node.name} from {node.origin}: don't know how to handle conditional {child.type}")
 
+		# An AND or OR of a single term is just that term
+		if len(term.clauses) == 1:
+			term = term.clauses[0]
+
 		# print("Parsed conditional %s: %s" % (node.name, term.dump()))
 		return term
 
@@ -348,6 +377,9 @@ class Resource(NamedConfigurable):
 	schema = []
 
 	def __init__(self, name):
+		# resource names end up as dict keys all over the place
+		if isinstance(name, str):
+			name = sys.intern(name)
 		super().__init__(name)
 
 		self.target = None
@@ -376,7 +408,7 @@ class Resource(NamedConfigurable):
 
 	@property
 	def predictions(self):
-		return []
+		return ()
 
 	def predictOutcome(self, driver, variables):
 		predictions = self.predictions
@@ -409,7 +441,7 @@ class StringValuedResource(Resource):
 		return "%s=\"%s\"" % (self.name, self.value)
 
 	def acquire(self, driver):
-		self.target.logInfo("%s = %s" % (self.name, self.value))
+		self.target.logInfo("%s = %s", self.name, self.value)
 		return True
 
 	def release(self, driver):
@@ -427,6 +459,17 @@ class SubsystemResource(Resource):
 		return bool(self.packages)
 
 	def acquire(self, driver):
+		node = self.target
+
+		# Check (and install) all packages in one go, rather than
+		# having every PackageResource talk to the node separately.
+		packageManager = node.packageManager
+		if packageManager is not None and len(self.packages) > 1:
+			missing = packageManager.checkPackages(node, self.packages)
+			if missing:
+				susetest.say(f"Trying to install packages {' '.join(missing)}")
+				packageManager.installPackages(node, missing)
+
 		okay = True
 		for package in self.packages:
 			pkg = self.target.requirePackage(package)
@@ -466,7 +509,7 @@ class PackageResource(Resource):
 			return False
 
 		if packageManager.checkPackage(node, self.package):
-			node.logInfo(f"Package {self.package} already installed on {node.name}")
+			node.logInfo("Package %s already installed on %s", self.package, node.name)
 			return True
 
 		susetest.say(f"Trying to install package {self.package}")
@@ -530,6 +573,9 @@ class UserResource(Resource):
 		self._home = None
 		self._forced = False
 
+		# (password, algorithm) -> crypted password
+		self._crypted = {}
+
 	@property
 	def is_valid(self):
 		return bool(self.login)
@@ -543,7 +589,7 @@ class UserResource(Resource):
 
 	def acquire(self, driver):
 		if self.uid is not None:
-			self.target.logInfo("found user %s; uid=%s" % (self.login, self.uid))
+			self.target.logInfo("found user %s; uid=%s", self.login, self.uid)
 			return True
 
 		useradd = self.target.optionalExecutable("useradd")
@@ -558,7 +604,7 @@ class UserResource(Resource):
 			self.target.logFailure(f"useradd {self.login} failed")
 			return False
 
-		self.target.logInfo("created user %s; uid=%s" % (self.login, self.uid))
+		self.target.logInfo("created user %s; uid=%s", self.login, self.uid)
 		return True
 
 	def release(self, driver):
@@ -586,41 +632,67 @@ class UserResource(Resource):
 		if not self.target.runOrFail(cmd, user = "root"):
 			return False
 
-		self.target.logInfo(f"changed password for user {login}")
+		self.target.logInfo("changed password for user %s", login)
 		return True
 
 	@property
 	def uid(self):
 		if self._uid is None:
-			self._uid = self._run_and_capture("id -u")
+			self._load_identity()
 		return self._uid
 
 	@property
 	def gid(self):
 		if self._gid is None:
-			self._gid = self._run_and_capture("id -g")
+			self._load_identity()
 		return self._gid
 
 	@property
 	def groups(self):
 		if self._groups is None:
-			res = self._run_and_capture("id -G")
-			if res is not None:
-				self._groups = res.split()
+			self._load_identity()
 		return self._groups
 
 	@property
 	def home(self):
 		if self._home is None:
-			self._home = self._run_and_capture("echo $HOME")
+			self._load_identity()
 		return self._home
 
+	# Every remote command is a round trip to the SUT, so query all of
+	# the user's identity in one go rather than one command per property.
+	# Each field is echoed on a line of its own, so that one failing
+	# command (or an unset $HOME) does not shift the others. Fields that
+	# are already known (eg from createUserFallback) are left alone.
+	def _load_identity(self):
+		status = self.target.run('echo "$(id -u)"; echo "$(id -g)"; echo "$(id -G)"; echo "$HOME"',
+				quiet = True, user = self.login, stdout = bytearray())
+		if not status:
+			return
+
+		lines = [line.strip() for line in status.stdoutString.split("\n")]
+		uid, gid, groups, home = (lines + [""] * 4)[:4]
+
+		if self._uid is None and uid:
+			self._uid = uid
+		if self._gid is None and gid:
+			self._gid = gid
+		if self._groups is None and groups:
+			self._groups = groups.split()
+		if self._home is None and home:
+			self._home = home
+
 	def encrypt_password(self, algorithm = None):
 		if algorithm is None:
 			algorithm = crypt.METHOD_SHA256
 
 		if self.password is not None:
-			self.encrypted_password = crypt.crypt(self.password, algorithm)
+			key = (self.password, algorithm)
+			encrypted = self._crypted.get(key)
+			if encrypted is None:
+				encrypted = crypt.crypt(self.password, algorithm)
+				self._crypted[key] = encrypted
+			self.encrypted_password = encrypted
 		return self.encrypted_password
 
 	def _build_useradd(self):
@@ -657,19 +729,19 @@ class UserResource(Resource):
 
 		usedUids = set()
 		for e in editor.entries():
-			usedUids.add(e.uid)
+			if e.uid and e.uid.isdigit():
+				usedUids.add(int(e.uid))
 
-		self._uid = None
-		while minUid < 6666:
-			if str(minUid) not in usedUids:
-				self._uid = str(minUid)
-				break
+		while minUid in usedUids:
 			minUid += 1
 
-		if not self._uid:
-			self.target.logInfo("Did not find a free uid for {self.login}")
+		if minUid >= 6666:
+			self._uid = None
+			self.target.logInfo(f"Did not find a free uid for {self.login}")
 			return False
 
+		self._uid = str(minUid)
+
 		self._gid = self.findGID("users")
 		if self._gid is None:
 			self._gid = "10000"
@@ -683,8 +755,7 @@ class UserResource(Resource):
 		editor.addOrReplaceEntry(e)
 		editor.commit()
 
-		self.target.run(f"mkdir -p {self._home}")
-		self.target.run(f"chown {self._uid}:{self._gid} {self._home}")
+		self.target.run(f"mkdir -p {self._home} && chown {self._uid}:{self._gid} {self._home}")
 
 		return True
 
@@ -739,6 +810,7 @@ class ExecutableResource(PackageBackedResource):
 	]
 
 	PATH = "/sbin:/usr/sbin:/bin:/usr/bin"
+	ENVIRON = { "PATH": PATH }
 
 	def __init__(self, *args, **kwargs):
 		super().__init__(*args, **kwargs)
@@ -752,9 +824,17 @@ class ExecutableResource(PackageBackedResource):
 	def describe(self):
 		return "executable(%s)" % self.name
 
+	# Most executables have no expected failures or errors; avoid
+	# building a new list just to find that out.
 	@property
 	def predictions(self):
-		return self._expected_failures + self._expected_errors
+		failures = self._expected_failures
+		errors = self._expected_errors
+		if not errors:
+			return failures
+		if not failures:
+			return errors
+		return failures + errors
 
 	def acquire(self, driver):
 		if super().acquire(driver):
@@ -768,6 +848,26 @@ class ExecutableResource(PackageBackedResource):
 
 		return self.locateBinary(self.target, executable)
 
+	# Locate several executables with a single command, and remember
+	# what we found in the node's cache for locateBinary to pick up.
+	@classmethod
+	def locateBinaries(klass, node, executables):
+		pending = [e for e in executables if e not in node._binaryPaths]
+		if len(pending) < 2:
+			return
+
+		names = " ".join(f'"{e}"' for e in pending)
+		cmd = f'for e in {names}; do echo "$(type -p "$e")"; done'
+
+		st = node.run(cmd, environ = klass.ENVIRON, quiet = True, stdout = bytearray())
+		if not st:
+			return
+
+		for executable, line in zip(pending, st.stdoutString.split("\n")):
+			path = line.strip()
+			if path:
+				node._binaryPaths[executable] = path
+
 	def locateBinary(self, node, executable):
 		# Caveat: type -p does not follow symlinks. If the user needs the realpath,
 		# (like, for instance, SELinux label checking) they need to chase symlink
@@ -775,12 +875,22 @@ class ExecutableResource(PackageBackedResource):
 		#cmd = '_path=$(type -p "%s"); test -n "$_path" && realpath "$_path"'
 		cmd = 'type -p "%s"'
 
-		node.logInfo("Locating binary file for command `%s'" % executable)
-		st = node.run(cmd % executable, environ = { "PATH": self.PATH }, stdout = bytearray())
+		# Several resources may refer to the same executable. We only
+		# remember binaries we actually found, so there's nothing to
+		# invalidate when a package gets installed later on.
+		path = node._binaryPaths.get(executable)
+		if path is not None:
+			node.logInfo("Located executable %s at %s", executable, path)
+			self.path = path
+			return True
+
+		node.logInfo("Locating binary file for command `%s'", executable)
+		st = node.run(cmd % executable, environ = self.ENVIRON, stdout = bytearray())
 		if st and st.stdout:
 			path = st.stdoutString.strip()
 			if path:
-				node.logInfo("Located executable %s at %s" % (executable, path))
+				node.logInfo("Located executable %s at %s", executable, path)
+				node._binaryPaths[executable] = path
 				self.path = path
 				return True
 
@@ -795,7 +905,7 @@ class ExecutableResource(PackageBackedResource):
 		if self._default_user and 'user' not in kwargs:
 			kwargs['user'] = self._default_user
 
-		return self.target.run("%s %s" % (self.path, " ".join(args)), **kwargs)
+		return self.target.run(self._commandLine(args), **kwargs)
 
 	def runOrFail(self, *args, **kwargs):
 		assert(self.path)
@@ -803,7 +913,14 @@ class ExecutableResource(PackageBackedResource):
 		if self._default_user and 'user' not in kwargs:
 			kwargs['user'] = self._default_user
 
-		return self.target.runOrFail("%s %s" % (self.path, " ".join(args)), **kwargs)
+		return self.target.runOrFail(self._commandLine(args), **kwargs)
+
+	def _commandLine(self, args):
+		if not args:
+			return self.path
+		if len(args) == 1:
+			return self.path + " " + args[0]
+		return self.path + " " + " ".join(args)
 
 class ServiceResource(PackageBackedResource):
 	resource_type = "service"
@@ -933,7 +1050,10 @@ class PathResource(PackageBackedResource):
 		return True
 
 	# this is the namedtuple type that the stat() method returns
-	xstat = functools.namedtuple('stat', ['user', 'group', 'permissions'])
+	xstat = collections.namedtuple('stat', ['user', 'group', 'permissions'])
+
+	# matches the output of the stat command below
+	STAT_RE = re.compile(r"user=(\S+) group=(\S+) permissions=(\S+)")
 
 	def stat(self):
 		assert(self.path)
@@ -941,11 +1061,15 @@ class PathResource(PackageBackedResource):
 		cmd = f"stat -c 'user=%U group=%G permissions=%03a' {self.path}"
 		st = self.target.run(cmd, user = 'root')
 		if not st:
-			self.logFailure(f"cannot stat {self.path}: {st.message}")
+			self.target.logFailure(f"cannot stat {self.path}: {st.message}")
+			return None
+
+		m = self.STAT_RE.match(st.stdoutString)
+		if m is None:
+			self.target.logFailure(f"cannot parse stat output for {self.path}")
 			return None
 
-		kwargs = dict([s.split('=') for s in st.stdoutString.split()])
-		return self.xstat(**kwargs)
+		return self.xstat(*m.groups())
 
 class DirectoryResource(PathResource):
 	resource_type = "directory"
@@ -1047,6 +1171,9 @@ class AuditResource(LogResource):
 	resource_type = "audit"
 	name = "audit"
 
+	# audit type -> "type=TYPE msg=" prefix, see handleAuditMessage
+	_weirdPrefixes = {}
+
 	def acquire(self, driver):
 		node = self.target
 		self.mon = node.monitor("audit", self.handleAuditMessage)
@@ -1056,14 +1183,22 @@ class AuditResource(LogResource):
 
 	def handleAuditMessage(self, seq, type, formatted):
 		# print(f"handleAuditMessage({type}, {formatted}")
-		if type.lower() != "avc":
+		# This gets called for every audit record, so bail out early
+		# if nobody is interested. The audit type usually comes in
+		# upper case, so try that before lowercasing it.
+		if not self._filters:
+			return
+		if type != "AVC" and type.lower() != "avc":
 			return
 
 		# On CentOS8, the binary audit messages we receive via audispd seem to be
 		# somewhat redundant, in that the formatted message start with
 		#  type=TYPE msg=.... rest of message ...
 		# If we detect this, we strip off the redundant gunk
-		rhel_weird_prefix = f"type={type} msg=";
+		rhel_weird_prefix = self._weirdPrefixes.get(type)
+		if rhel_weird_prefix is None:
+			rhel_weird_prefix = f"type={type} msg="
+			self._weirdPrefixes[type] = rhel_weird_prefix
 		if formatted.startswith(rhel_weird_prefix):
 			formatted = formatted[len(rhel_weird_prefix):]
 
@@ -1091,8 +1226,6 @@ class JournalResource(LogResource):
 		node = self.target
 
 		# We should really make this a systemd unit
-		import twopence
-
 		self.target.logInfo("starting journal processor")
 		self.target._run("twopence_journal --mode server --background", quiet = True)
 
@@ -1113,28 +1246,35 @@ class JournalResource(LogResource):
 		return True
 
 	def processMessages(self, quiet = False):
-		import twopence
+		# If nobody looks at the messages, just drain the journal processor
+		if quiet and not self._filters:
+			return self.flushMessages()
 
 		self.target.logInfo("querying journal processor")
 		cmd = twopence.Command("twopence_journal", stdout = bytearray(), quiet = True)
 		st = self.target._run(cmd)
 
+		# The journal dump can be large; split the raw buffer and decode
+		# line by line rather than decoding all of it in one go.
+		Message = self.Message
+		filterMessage = self.filterMessage
+
 		processed = []
-		for line in st.stdout.decode("utf-8").split('\n'):
-			if not line:
+		for raw in st.stdout.split(b'\n'):
+			if not raw:
 				continue
 
-			args = line.split('|')
-			m = self.Message(*args)
+			line = raw.decode("utf-8")
+			m = Message(*line.split('|'))
 
 			if m.transport == 'stdout' and m.application.startswith("twopence_test"):
 				continue
 
-			self.filterMessage(m)
+			filterMessage(m)
 			processed.append(line)
 
 		if processed and not quiet:
-			self.target.logInfo("Received %d journal messages" % len(processed))
+			self.target.logInfo("Received %d journal messages", len(processed))
 
 			# Print the messages themselves w/o prefixing them with the node name
 			# This makes it easier to cut and paste them into bug reports
@@ -1215,6 +1355,9 @@ class APIResource(Resource):
 class ApplicationManagerResource(APIResource):
 	resource_type = "application-manager"
 
+	# (class_id, module) -> application class
+	_classCache = {}
+
 	def describe(self):
 		values = [self.name]
 		if self.class_id:
@@ -1233,11 +1376,16 @@ class ApplicationManagerResource(APIResource):
 			target.logInfo(f"Cannot attach application {self.name}: no class-id specified")
 			return False
 
-		# Find the class
-		applicationClass = susetest.Application.find(self.class_id, moduleName = self.module)
+		# Find the class. Application.find scans the module each time,
+		# so remember what we found for the other nodes.
+		key = (self.class_id, self.module)
+		applicationClass = self._classCache.get(key)
 		if applicationClass is None:
-			target.logInfo(f"Unable to find application class {self.class_id}")
-			return False
+			applicationClass = susetest.Application.find(self.class_id, moduleName = self.module)
+			if applicationClass is None:
+				target.logInfo(f"Unable to find application class {self.class_id}")
+				return False
+			self._classCache[key] = applicationClass
 
 		# Create instance
 		application = applicationClass(driver, target)
@@ -1269,13 +1417,15 @@ class ResourceSettings(ConfigOpaque):
 			desc += f" from {self.origin}"
 		return desc
 
-	@property
-	def isPackageBacked(self):
-		return issubclass(self.resourceClass, PackageBackedResource)
+	# set by wrapKlass, based on the resource class
+	isPackageBacked = False
 
 	def setBackingPackage(self, packageName):
 		currentValue = self.get_value("package")
-		if currentValue and currentValue != packageName:
+		if currentValue == packageName:
+			return
+
+		if currentValue:
 			raise BadResource(f"{self.longdesc}: conflicting package names {currentValue} vs {packageName}")
 
 		self.set_value("package", packageName)
@@ -1286,7 +1436,10 @@ class ResourceSettings(ConfigOpaque):
 
 def wrapKlass(klass):
 	new_class_name = f"{klass.__name__}Settings"
-	new_klass = type(new_class_name, (ResourceSettings, ), {'resourceClass': klass})
+	new_klass = type(new_class_name, (ResourceSettings, ), {
+				'resourceClass': klass,
+				'isPackageBacked': issubclass(klass, PackageBackedResource),
+			})
 
 	return new_klass
 
@@ -1330,14 +1483,14 @@ class ResourceCollection(NamedConfigurable):
 		makeResourceDict(ApplicationManagerResource),
 	]
 
-	_initializedDictAccessors = set()
-
 	def __init__(self, *args, **argv):
 		super().__init__(*args, **argv)
 
-		self.initializedDictAccessors()
-
 		self._resourcesByType = {}
+
+		# resource type -> (resource class, settings dict), for createResource
+		self._resourceTypes = {}
+
 		for child in self._nodes.values():
 			resourceKlass = getattr(child, "_resourceKlass", None)
 			if resourceKlass is None:
@@ -1345,16 +1498,24 @@ class ResourceCollection(NamedConfigurable):
 
 			nodeDict = child.getObjectMember(self)
 			self._resourcesByType[child.key] = nodeDict
+			self._resourceTypes[child.key] = (resourceKlass, nodeDict)
+
+		# the set of resource types is fixed, so iterate over a tuple
+		self._resourcesByTypeSeq = tuple(self._resourcesByType.items())
 
 	def __str__(self):
 		return f"{self.__class__.__name__}({self.name})"
 
+	# Every collection class gets its accessors when it is defined, so
+	# that constructing a collection does not have to check for them.
+	def __init_subclass__(klass, **kwargs):
+		super().__init_subclass__(**kwargs)
+		klass.initializedDictAccessors()
+
+	# Note that this runs before Schema.initializeAll() has seen the class,
+	# so the accessors look up the dict getter only when called.
 	@classmethod
 	def initializedDictAccessors(klass):
-		if klass in ResourceCollection._initializedDictAccessors:
-			return
-		ResourceCollection._initializedDictAccessors.add(klass)
-
 		for item in klass.schema:
 			if not isinstance(item, DictNodeSchema):
 				continue
@@ -1368,25 +1529,47 @@ class ResourceCollection(NamedConfigurable):
 			# for a resource type named "package", create a property
 			# named "packages" that returns self._packages.values()
 			dictIteratorName = f"{item.key}s"
-			setattr(klass, dictIteratorName, property(item.dictValuesGetter))
+			setattr(klass, dictIteratorName, property(lambda self, item = item: item.dictValuesGetter(self)))
 
 			# print(f"Defined {klass.__name__}.{dictIteratorName}; returns list of {settingsKlass.__name__}")
 
 	@property
 	def allResources(self):
-		return functools.reduce(lambda a, b: a + b,
-				[list(dictNode.values()) for dictNode in self._resourcesByType.values()],
-				[])
+		return list(itertools.chain.from_iterable(dictNode.values() for key, dictNode in self._resourcesByTypeSeq))
 
 	def addResourceSettings(self, resInfo):
 		typeDict = self._resourcesByType[resInfo.resource_type]
 		typeDict.mergeItem(resInfo)
 
+	# Return a copy of this collection that can be merged into (or
+	# have packages resolved) without affecting the original.
+	# We copy the python containers only; the settings objects get
+	# a shallow copy that shares the underlying config node with the
+	# original. The only in-place change to those is setBackingPackage(),
+	# which records the same package name for every copy of a file.
+	def clone(self):
+		result = self.__class__(self.name)
+
+		for key, nodeDict in self._resourcesByTypeSeq:
+			typeDict = result._resourcesByType[key]
+			for resInfo in nodeDict.values():
+				if isinstance(resInfo, ResourceCollection):
+					resInfo = resInfo.clone()
+				else:
+					resInfo = copy.copy(resInfo)
+				typeDict.add(resInfo)
+
+		return result
+
 	def merge(self, other):
 		assert(isinstance(other, ResourceCollection))
 
-		for key, nodeDict in other._resourcesByType.items():
-			self._resourcesByType[key].merge(nodeDict)
+		# most files only define a few types of resources
+		for key, nodeDict in other._resourcesByTypeSeq:
+			if nodeDict.values():
+				self._resourcesByType[key].merge(nodeDict)
+
+ResourceCollection.initializedDictAccessors()
 
 class PackageResourceSettings(ResourceCollection):
 	resource_type = "package"
@@ -1442,6 +1625,15 @@ class ResourceContext(ResourceCollection):
 	def conditionals(self):
 		return self._conditionals.values()
 
+	def clone(self):
+		result = super().clone()
+
+		# Conditionals are never modified after loading, so share them
+		for cond in self.conditionals:
+			result._conditionals.add(cond)
+		result.applies = self.applies
+		return result
+
 	# A package is a collection of resources. We want all resources
 	# defined by it to refer back to the containing package by name,
 	# so that we can later automatically install the package if they're
@@ -1471,12 +1663,13 @@ class ResourceContext(ResourceCollection):
 		# We could also do just a simple dict.update() and be done with it.
 		# For robustness, we make sure the user does not define multiple conditionals
 		# with the same name in different files.
+		conditionals = self._conditionals
 		for cond in other.conditionals:
-			have = self._conditionals.get(cond.name)
+			have = conditionals.get(cond.name)
 			if have is not None:
 				raise BadConditional(f"{cond.name} from {cond.origin}: duplicate definition of resource conditional (also defined in {have.origin})")
 
-			self._conditionals.add(cond)
+			conditionals.add(cond)
 
 	def merge(self, other, target):
 		context = TargetEvalContext(target = target)
@@ -1490,11 +1683,11 @@ class ResourceContext(ResourceCollection):
 
 	def createResource(self, node, resourceType, resourceName):
 		# Given a name like "executable", retrieve the ExecutableResource class
-		typeDict = self._resourcesByType.get(resourceType)
-		if typeDict is None:
+		entry = self._resourceTypes.get(resourceType)
+		if entry is None:
 			raise ValueError(f"Undefined resource type {resourceType}")
 
-		resourceKlass = typeDict.item_class.resourceClass
+		resourceKlass, typeDict = entry
 
 		# Instantiante the resource...
 		res = resourceKlass(resourceName)
@@ -1524,17 +1717,22 @@ class ResourceContext(ResourceCollection):
 		return res
 
 	def resolveConditionals(self, res):
-		if isinstance(res, ExecutableResource):
-			for name in res._expected_failures_by_name:
-				cond = self._conditionals.get(name)
-				if cond is None:
-					raise BadConditional(f"{cond.longdesc}: {res} references unknown conditional {name}")
-				res._expected_failures.append(ExpectedFailure.fromConditional(cond))
-			for name in res._expected_errors_by_name:
-				cond = self._conditionals.get(name)
-				if cond is None:
-					raise BadConditional(f"{cond.longdesc}: {res} references unknown conditional {name}")
-				res._expected_errors.append(ExpectedError.fromConditional(cond))
+		if not isinstance(res, ExecutableResource):
+			return
+
+		getConditional = self._conditionals.get
+		for names, expectationKlass, expectations in (
+				(res._expected_failures_by_name, ExpectedFailure, res._expected_failures),
+				(res._expected_errors_by_name, ExpectedError, res._expected_errors)):
+			if not names:
+				continue
+
+			conds = [getConditional(name) for name in names]
+			if any(cond is None for cond in conds):
+				missing = [name for name, cond in zip(names, conds) if cond is None]
+				raise BadConditional(f"{res} references unknown conditional(s) {', '.join(missing)}")
+
+			expectations.extend(expectationKlass.fromConditional(cond) for cond in conds)
 
 class ResourceFile(ResourceContext):
 	resource_type = "resources"
@@ -1547,6 +1745,12 @@ class ResourceFile(ResourceContext):
 	def contexts(self):
 		return self._contexts.values()
 
+	def clone(self):
+		result = super().clone()
+		for context in self.contexts:
+			result._contexts.add(context.clone())
+		return result
+
 ##################################################################
 # Global resource inventory
 ##################################################################
@@ -1554,14 +1758,18 @@ class ResourceInventory:
 	def __init__(self):
 		self.resources = []
 
+		# (id(target), type, name) -> resource. Each resource holds a
+		# reference to its target, so the id cannot be reused while
+		# the entry exists.
+		self._index = {}
+
 	def findResource(self, node, resourceType, resourceName):
-		for res in self.resources:
-			if res.target == node \
-			   and res.resource_type == resourceType \
-			   and res.name == resourceName:
-				return res
+		return self._index.get((id(node), resourceType, resourceName))
 
 	def addResource(self, res):
+		key = (id(res.target), res.resource_type, res.name)
+		if key not in self._index:
+			self._index[key] = res
 		self.resources.append(res)
 
 class TargetEvalContext:
@@ -1571,6 +1779,7 @@ class TargetEvalContext:
 		self.variables = variables
 
 		self._parsedOS = None
+		self._lowerVariables = None
 
 	def testFeature(self, name):
 		if self.target is None:
@@ -1591,11 +1800,19 @@ class TargetEvalContext:
 
 		return actual in values
 
+	# OneOf conditionals have their values lowercased already; lowercase
+	# our variables just once rather than on every test.
 	def testValues(self, name, values):
-		actual = self.variables.get(name).lower()
+		lowerVariables = self._lowerVariables
+		if lowerVariables is None:
+			lowerVariables = {key: (value.lower() if isinstance(value, str) else value)
+						for key, value in self.variables.items()}
+			self._lowerVariables = lowerVariables
+
+		actual = lowerVariables.get(name)
 
 		# print(f"   testParameter({name}={actual}, values={values})")
-		if name is None:
+		if actual is None:
 			return False
 
 		return actual in values
@@ -1621,6 +1838,16 @@ class BadConditional(Exception):
 # from one or more config files.
 ##################################################################
 class ResourceLoader:
+	cacheSize = 100
+
+	def __init__(self):
+		# Several nodes usually load the same platform files, so keep
+		# the parsed files around as prototypes. Callers merge the returned
+		# file into their own context, which may modify it, so the cache
+		# holds a clone that nobody else gets to see.
+		# (name, path signature) -> ResourceFile
+		self._cache = {}
+
 	def loadResources(self, name, path = None):
 		name = name.lower()
 
@@ -1633,10 +1860,24 @@ class ResourceLoader:
 				raise KeyError(f"Unable to load resources from {path} - invalid path name")
 			found = [path]
 
+		signature = []
+		for path in found:
+			st = os.stat(path)
+			signature.append((os.path.abspath(path), st.st_mtime_ns, st.st_size))
+		key = (name, tuple(signature))
+
+		prototype = self._cache.get(key)
+		if prototype is not None:
+			return prototype.clone()
+
 		file = ResourceFile(name)
 		for path in found:
 			file.configureFromPath(path)
 
+		if len(self._cache) >= self.cacheSize:
+			del self._cache[next(iter(self._cache))]
+		self._cache[key] = file.clone()
+
 		return file
 
 	def findResourceFiles(self, name):
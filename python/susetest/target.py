@@ -61,6 +61,9 @@ class Target(twopence.Target):
 		self._resources = {}
 		self._enabled_features = []
 
+		# executable name -> path, as located by ExecutableResource
+		self._binaryPaths = {}
+
 		self._applications = {}
 		self.managers = SimpleDictFacade(self._applications)
 
@@ -391,8 +394,16 @@ class Target(twopence.Target):
 	def is_systemd(self):
 		return True
 
-	def logInfo(self, message):
-		self.logger.logInfo(self.name + ": " + message)
+	# Callers on hot paths can pass printf style arguments, which are
+	# only formatted if informational messages are being logged at all.
+	def logInfo(self, message, *args):
+		logger = self.logger
+		if not logger.infoEnabled:
+			return
+
+		if args:
+			message = message % args
+		logger.logInfo(self.name + ": " + message)
 
 	def _logInfo(self, message):
 		self.logger.logInfo(message)
@@ -390,10 +390,11 @@ class TestsuiteInfo:
 	def actionSetup(self, driver, dummy = None):
 		# First set up everything the drivers needs/thinks we need
 		# This includes setup of features, like SELinux
-		driver.beginSetup()
+		executables = [req for req in self._resources if req.resourceType == 'executable']
+		driver.beginSetup(executables)
 
 		# Request all resources that the user specified in the test
-		# script using susetest.requireResource() and friends
+		# script using susetest.requireResource() and friends.
 		for req in self._resources:
 			driver.beginTest(req.testID, f"acquire {req.resourceType} resource {req.resourceName}")
 			req.request(driver)
@@ -643,6 +644,8 @@ class TestDefinition:
 			help = "Enable debugging at the twopence layer")
 		p.add_option('--config',
 			help = "Path to config file")
+		p.add_option('--stream-journal', action = 'store_true', default = False,
+			help = "Write completed test cases to disk instead of keeping the journal in memory")
 		p.add_option('--skip', action = 'append', default = [],
 			help = "Skip the named test case or group")
 		p.add_option('--only', action = 'append', default = [],
@@ -745,6 +748,7 @@ class TestDefinition:
 		driver = Driver(suite.name, config_path = opts.config)
 
 		driver.verbose = not opts.quiet
+		driver.streamJournal = opts.stream_journal
 
 		suite.prepare(driver)
 
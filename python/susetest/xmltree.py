@@ -10,6 +10,50 @@
 
 import xml.etree.ElementTree as ET
 import xml.etree.ElementInclude as ElementInclude
+import io
+import os
+import sys
+import functools
+import contextlib
+from xml.sax.saxutils import quoteattr
+
+##################################################################
+# Open a file for writing an XML document to it.
+# Documents are written in lots of small pieces, so use a large
+# buffer, rounded to the file system's preferred block size.
+##################################################################
+def openBufferedOutput(filename, bufferSize = 1024 * 1024):
+	raw = io.FileIO(filename, "w")
+	try:
+		blksize = os.fstat(raw.fileno()).st_blksize
+	except OSError:
+		blksize = 0
+	if blksize > 0:
+		bufferSize = (bufferSize + blksize - 1) // blksize * blksize
+	return io.BufferedWriter(raw, bufferSize)
+
+# Write to filename.new and rename it to filename when done. If writing
+# fails, remove the partial file and leave the old one alone.
+@contextlib.contextmanager
+def replaceFile(filename):
+	tempname = filename + ".new"
+
+	out = openBufferedOutput(tempname)
+	try:
+		yield out
+		out.close()
+	except:
+		out.close()
+		os.remove(tempname)
+		raise
+
+	os.rename(tempname, filename)
+
+# The same attribute values (host names, users, package names) show up
+# over and over in a journal, so remember how we quoted them.
+@functools.lru_cache(maxsize = 4096)
+def quoteAttribute(value):
+	return quoteattr(value)
 
 ##################################################################
 # Values represented by attributes to an XML node
@@ -32,8 +76,16 @@ class AttributeSchema:
 		if value is not None:
 			object.node.attrib[self.name] = str(value)
 		else:
-			try: del object.node.attrib[self.name]
-			except: pass
+			object.node.attrib.pop(self.name, None)
+
+# For attributes that take one of a small set of values over and
+# over again, such as a test status or an OS name
+class InternedAttributeSchema(AttributeSchema):
+	def _setter(self, object, value):
+		if value is not None:
+			object.node.attrib[self.name] = sys.intern(str(value))
+		else:
+			object.node.attrib.pop(self.name, None)
 
 class IntAttributeSchema(AttributeSchema):
 	typeconv = int
@@ -58,6 +110,11 @@ class NodeSchema:
 	def _adder(self, object, childObject):
 		setattr(object, self.attr_name, childObject)
 
+	# Return the python source for what _adder() does, for use by
+	# the child dispatcher compiled in XMLBackedNode
+	def _adder_source(self, value):
+		return f"self.{self.attr_name} = {value}"
+
 	def _factory(self, object):
 		childObject = getattr(object, self.attr_name, None)
 		if childObject is None:
@@ -73,6 +130,9 @@ class ListNodeSchema(NodeSchema):
 		current = getattr(object, self.attr_name)
 		current.append(childObject)
 
+	def _adder_source(self, value):
+		return f"self.{self.attr_name}.append({value})"
+
 	def _factory(self, object):
 		childObject = self.childClass(ET.SubElement(object.node, self.name))
 		# self._adder(object, childObject)
@@ -95,11 +155,47 @@ class XMLBackedNode:
 			type._initer(self)
 
 		for child in node:
-			type = self._children.get(child.tag)
-			if type is None:
-				raise KeyError(f"Unsupported XML element <{child.tag}> in <{node.tag}>")
+			self._dispatch_child(child)
+
+	def __init_subclass__(klass, **kwargs):
+		super().__init_subclass__(**kwargs)
+		klass._compile_dispatcher()
+
+	# The set of child elements is fixed per class, so rather than looking up
+	# the schema for every child element we load, compile a function with a
+	# fixed if/elif cascade that constructs the child object and attaches it
+	# to the right member.
+	# Classes that reimplement addChild() still get called through it.
+	@classmethod
+	def _compile_dispatcher(klass):
+		namespace = {}
+		lines = ["def _dispatch_child(self, child):",
+			 "	tag = child.tag"]
+
+		customAdder = klass.addChild is not XMLBackedNode.addChild
+
+		keyword = "if"
+		for index, type in enumerate(klass.children):
+			schemaName = f"_schema{index}"
+			namespace[schemaName] = type
+			value = f"{schemaName}.childClass(child)"
+
+			if customAdder:
+				statement = f"self.addChild({schemaName}, {value})"
+			else:
+				statement = type._adder_source(value)
+
+			lines.append(f"	{keyword} tag == {type.name!r}:")
+			lines.append(f"		{statement}")
+			keyword = "elif"
+
+		lines.append("	else:" if klass.children else "	if True:")
+		lines.append("		raise KeyError(f\"Unsupported XML element <{tag}> in <{self.node.tag}>\")")
 
-			self.addChild(type, type.childClass(child))
+		code = compile("\n".join(lines), f"<{klass.__name__}._dispatch_child>", "exec")
+		exec(code, namespace)
+
+		klass._dispatch_child = namespace['_dispatch_child']
 
 	@classmethod
 	def _init_schema(klass):
@@ -150,8 +246,6 @@ class XMLBackedNode:
 				type._setter(self, value)
 
 	def save(self, filename):
-		import os
-
 		tree = ET.ElementTree(self.node)
 
 		# ElementTree.indent was added in 3.9
@@ -186,14 +280,16 @@ class XMLBackedNode:
 
 			diy_indent(tree.getroot())
 
-		tree.write(filename + ".new", "UTF-8", xml_declaration = True)
-		os.rename(filename + ".new", filename)
+		with replaceFile(filename) as out:
+			tree.write(out, "UTF-8", xml_declaration = True)
 
 		if False:
 			print(f"--- {filename} ---")
 			ET.dump(tree.getroot())
 			print("---")
 
+XMLBackedNode._compile_dispatcher()
+
 ##################################################################
 # Obsolete stuff, will go away
 ##################################################################
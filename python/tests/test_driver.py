@@ -0,0 +1,41 @@
+import unittest
+import tempfile
+import contextlib
+import io
+import os
+
+from susetest.driver import Driver
+
+class DriverJournalTest(unittest.TestCase):
+	def createJournal(self, workspace, stream):
+		with contextlib.redirect_stdout(io.StringIO()):
+			driver = Driver("demo")
+			driver.workspace = workspace
+			if stream is not None:
+				driver.streamJournal = stream
+			driver._set_journal()
+		return driver
+
+	def testDefault(self):
+		with tempfile.TemporaryDirectory() as workspace:
+			driver = self.createJournal(workspace, None)
+			self.assertIsNone(driver._logger._journal.stream)
+
+			with contextlib.redirect_stdout(io.StringIO()):
+				driver.close()
+
+	def testStreamJournal(self):
+		with tempfile.TemporaryDirectory() as workspace:
+			driver = self.createJournal(workspace, True)
+
+			stream = driver._logger._journal.stream
+			self.assertIsNotNone(stream)
+
+			with contextlib.redirect_stdout(io.StringIO()):
+				driver.close()
+
+			self.assertTrue(stream.spool.closed)
+			self.assertTrue(os.path.exists(os.path.join(workspace, "junit-results.xml")))
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+import tempfile
+import contextlib
+import io
+import os
+import xml.etree.ElementTree as ET
+
+from susetest import journal
+
+class StreamJournalTest(unittest.TestCase):
+	def setUp(self):
+		self.tmpdir = tempfile.TemporaryDirectory()
+		self.path = os.path.join(self.tmpdir.name, "junit-results.xml")
+
+	def tearDown(self):
+		self.tmpdir.cleanup()
+
+	def runTests(self, stream):
+		with contextlib.redirect_stdout(io.StringIO()):
+			j = journal.create("demo", stream = stream)
+			group = j.beginGroup("setup")
+
+			test = group.beginTest("t1", "background command")
+			cmd = test.logCommand("client", "sleep 1", background = True)
+			cmd.generateId()
+			test.setStatus("success")
+			test.complete()
+
+			# The command finishes after the test case was completed
+			cont = test.logCommandContinuation(cmd.id)
+			cont.recordStdout(b"done")
+			cont.recordStatus(exit_code = 0)
+
+			test = group.beginTest("t2", "plain test")
+			test.logMessage("hello")
+			test.setStatus("success")
+			test.complete()
+
+			j.finish()
+			j.save(self.path)
+			j.close()
+
+		return ET.parse(self.path).getroot()
+
+	def testLateContinuation(self):
+		root = self.runTests(stream = True)
+
+		testcases = root.findall("testsuite/testcase")
+		self.assertEqual(len(testcases), 2)
+
+		commands = testcases[0].findall("log/command")
+		self.assertEqual(len(commands), 2)
+		self.assertEqual(commands[1].find("status").get("exit-code"), "0")
+
+		messages = testcases[1].findall("log/info")
+		self.assertEqual(len(messages), 1)
+
+	def testMatchesNonStreaming(self):
+		streamed = self.runTests(stream = True)
+		regular = self.runTests(stream = False)
+
+		def strip(node):
+			for e in node.iter():
+				# Command ids are allocated globally
+				for attr in ("time", "timestamp", "id"):
+					e.attrib.pop(attr, None)
+				e.text = (e.text or "").strip()
+				e.tail = None
+			return ET.tostring(node)
+
+		self.assertEqual(strip(streamed), strip(regular))
+
+	def testPiecewiseOutput(self):
+		with contextlib.redirect_stdout(io.StringIO()):
+			j = journal.create("demo")
+			test = j.beginGroup("setup").beginTest("t1", "chatty command")
+			cmd = test.logCommand("client", "yes")
+			for i in range(100):
+				cmd.recordStdout(f"line {i}")
+
+			self.assertEqual(cmd.stdout.text.split("\n")[-1], "line 99")
+
+			cmd.recordStdout(b"tab\tand \x07bell")
+			test.setStatus("success")
+			test.complete()
+			j.finish()
+			j.save(self.path)
+
+		lines = ET.parse(self.path).getroot().find("testsuite/testcase/log/command/stdout").text.strip().split("\n")
+		self.assertEqual(len(lines), 101)
+		self.assertEqual(lines[0].strip(), "line 0")
+		self.assertEqual(lines[-1].strip(), "tab\tand <BEL>bell")
+
+	def testSpoolClosed(self):
+		with contextlib.redirect_stdout(io.StringIO()):
+			j = journal.create("demo", stream = True)
+			stream = j.stream
+			j.close()
+
+		self.assertTrue(stream.spool.closed)
+		self.assertIsNone(j.stream)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,34 @@
+import unittest
+import tempfile
+import contextlib
+import io
+import os
+import xml.etree.ElementTree as ET
+
+from susetest.logger import Logger
+
+class LoggerCloseTest(unittest.TestCase):
+	def testCloseWithOpenTest(self):
+		hooks = []
+
+		with tempfile.TemporaryDirectory() as tmpdir:
+			path = os.path.join(tmpdir, "junit-results.xml")
+
+			with contextlib.redirect_stdout(io.StringIO()):
+				logger = Logger("demo", path)
+				logger.addPostTestHook(lambda: hooks.append(1))
+
+				logger.beginGroup("group")
+				logger.currentGroup.beginTest(name = "t1", description = "interrupted test")
+
+				# Closing in the middle of a test (eg after KeyboardInterrupt)
+				# must not report it as passed
+				logger.close()
+
+			testcase = ET.parse(path).getroot().find("testsuite/testcase")
+
+		self.assertIsNotNone(testcase.find("error"))
+		self.assertEqual(hooks, [])
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+import tempfile
+import os
+
+from susetest.resources import ResourceFile, ResourceLoader, ResourceCollection, ExecutableResource, makeResourceDict
+
+RESOURCES = '''
+executable ls {
+}
+package coreutils {
+	executable cat {
+	}
+}
+context extra {
+	executable find {
+	}
+}
+'''
+
+def executableNames(context):
+	return sorted(res.name for res in context.executables)
+
+class ResourceFileTest(unittest.TestCase):
+	def setUp(self):
+		self.tmpdir = tempfile.TemporaryDirectory()
+		self.path = os.path.join(self.tmpdir.name, "demo.conf")
+		with open(self.path, "w") as f:
+			f.write(RESOURCES)
+
+	def tearDown(self):
+		self.tmpdir.cleanup()
+
+	def testClone(self):
+		file = ResourceFile("demo")
+		file.configureFromPath(self.path)
+
+		clone = file.clone()
+		self.assertEqual(executableNames(clone), ["ls"])
+		self.assertEqual([context.name for context in clone.contexts], ["extra"])
+
+		# Resolving packages adds coreutils' executables to the clone only
+		clone.resolvePackages()
+		self.assertEqual(executableNames(clone), ["cat", "ls"])
+		self.assertEqual(executableNames(file), ["ls"])
+
+		context = next(iter(clone.contexts))
+		context.addResourceSettings(next(iter(clone.executables)))
+		self.assertEqual(executableNames(next(iter(file.contexts))), ["find"])
+
+	def testLoaderCache(self):
+		loader = ResourceLoader()
+
+		first = loader.loadResources("demo", self.path)
+		first.resolvePackages()
+
+		# The second load comes from the cache, and must not see
+		# what the first caller did to its copy
+		second = loader.loadResources("demo", self.path)
+		self.assertIsNot(second, first)
+		self.assertEqual(executableNames(second), ["ls"])
+
+		# Changing the file invalidates the cache
+		with open(self.path, "a") as f:
+			f.write("executable grep {\n}\n")
+		third = loader.loadResources("demo", self.path)
+		self.assertEqual(executableNames(third), ["grep", "ls"])
+
+class ResourceCollectionTest(unittest.TestCase):
+	def testLateSubclass(self):
+		# A collection class defined after resources.py was imported
+		class Extra(ResourceCollection):
+			schema = [
+				makeResourceDict(ExecutableResource),
+			]
+
+		self.assertIsInstance(Extra.__dict__.get("executables"), property)
+
+if __name__ == '__main__':
+	unittest.main()